@@ -1,14 +1,25 @@
-from flask import Flask, request, session
+import logging
+from flask import Flask, request, session, g, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager, logout_user
 from models import db, User, Instance
-from config import SECRET_KEY, SQLALCHEMY_TRACK_MODIFICATIONS, INSTANCES_DIR
+from config import SECRET_KEY, SQLALCHEMY_TRACK_MODIFICATIONS, INSTANCES_DIR, TRUSTED_PROXIES
 import os
 from routes import register_routes  
 from instance_manager import get_or_create_instance_id, get_instance_path, is_valid_instance_id
+from archive import instance_exists
 from cleanup import start_cleanup_thread, verify_cleanup_system
+from metrics import timed, instrument_sqlalchemy, register_collector, collect_instance_count
+from logging_config import setup_logging, bind_request_id, reset_request_id, request_id_var
+from quotas import QuotaExceeded, check_request, check_instance_creation, check_note, resync_global_bytes
 import sqlite3
 
+setup_logging()
+logger = logging.getLogger('app')
+
 app = Flask(__name__)
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = SQLALCHEMY_TRACK_MODIFICATIONS
 
@@ -21,6 +32,9 @@ login_manager.login_view = 'index'
 
 db.init_app(app)
 
+instrument_sqlalchemy()
+register_collector(collect_instance_count)
+
 def check_and_update_schema(db_path):
     if not os.path.exists(db_path):
         return
@@ -40,7 +54,7 @@ def check_and_update_schema(db_path):
                 cursor.execute("ALTER TABLE user ADD COLUMN instance_id VARCHAR(36)")
                 cursor.execute("UPDATE user SET instance_id = ?", (instance_id,))
                 conn.commit()
-                print(f"Added instance_id column to user table for instance {instance_id}")
+                logger.info("Added instance_id column to user table", extra={'instance_id': instance_id})
             except sqlite3.OperationalError:
                 cursor.execute("SELECT id, username, password FROM user")
                 users = cursor.fetchall()
@@ -54,7 +68,7 @@ def check_and_update_schema(db_path):
                 cursor.execute("DROP TABLE user")
                 cursor.execute("ALTER TABLE user_temp RENAME TO user")
                 conn.commit()
-                print(f"Recreated user table with instance_id for instance {instance_id}")
+                logger.info("Recreated user table with instance_id", extra={'instance_id': instance_id})
     
     conn.close()
 
@@ -73,14 +87,66 @@ def load_user(user_id):
         
         return user
     except Exception as e:
-        print(f"Error loading user: {e}")
+        logger.warning("Error loading user: %s", e)
         logout_user()
         return None
 
+@app.before_request
+def bind_request_context():
+    g.request_id_token = bind_request_id(request.headers.get('X-Request-ID', '')[:64] or None)
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+@app.teardown_request
+def unbind_request_context(exc=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        reset_request_id(token)
+
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+@app.before_request
+def enforce_quotas():
+    if request.endpoint in ('static', 'metrics'):
+        return None
+    
+    # Only ids that already exist are trusted as a quota key; anything else
+    # is about to create a new instance and is charged to the client address.
+    instance_id = None
+    for candidate in (session.get('instance_id'), request.cookies.get('INSTANCE')):
+        if candidate and instance_exists(candidate):
+            instance_id = candidate
+            break
+    
+    try:
+        if instance_id is None:
+            # The bot browses over loopback and its first page load carries
+            # no INSTANCE cookie; it is already bounded by the bot quotas.
+            if request.remote_addr not in LOOPBACK_ADDRESSES:
+                check_request(request.remote_addr)
+                if request.endpoint is not None:
+                    check_instance_creation(request.remote_addr)
+        else:
+            check_request(instance_id)
+            if request.endpoint in ('add_note', 'upload_note'):
+                check_note(instance_id)
+    except QuotaExceeded as e:
+        response = jsonify({'success': False, 'message': e.message})
+        if e.retry_after:
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    
+    return None
+
 @app.before_request
 def before_request():
-    if request.endpoint != 'static':
-        instance_id = get_or_create_instance_id()
+    # Unmatched URLs only render the 404 page and must not create instances.
+    if request.endpoint not in (None, 'static', 'metrics'):
+        with timed('get_or_create_instance_id'):
+            instance_id = get_or_create_instance_id()
         
         previous_instance = session.get('instance_id')
         
@@ -90,14 +156,18 @@ def before_request():
         db_path = get_instance_path(instance_id, "app.db")
         app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
         
-        check_and_update_schema(db_path)
+        with timed('check_and_update_schema'):
+            check_and_update_schema(db_path)
         
-        with app.app_context():
-            db.create_all()
+        with timed('create_all'):
+            with app.app_context():
+                db.create_all()
 
 
 register_routes(app)
 
+resync_global_bytes()
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
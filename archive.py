@@ -0,0 +1,166 @@
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import logging
+from config import INSTANCES_DIR, ARCHIVE_COMPRESSION_LEVEL
+from metrics import timed, inc
+
+logger = logging.getLogger('archive')
+
+ARCHIVE_SUFFIX = '.tar.gz'
+
+# Chrome rebuilds all of these on demand; archiving them only costs space
+# and inodes. Singleton* are lock files that would block the next launch.
+CHROME_EXCLUDES = {
+    'Cache', 'Code Cache', 'GPUCache', 'ShaderCache', 'GrShaderCache',
+    'GraphiteDawnCache', 'DawnCache', 'DawnGraphiteCache', 'DawnWebGPUCache',
+    'CacheStorage', 'ScriptCache', 'Crashpad', 'Crash Reports', 'BrowserMetrics',
+    'component_crx_cache', 'optimization_guide_model_store', 'Safe Browsing',
+    'SingletonLock', 'SingletonSocket', 'SingletonCookie',
+}
+
+_INSTANCE_ID_RE = re.compile(r'^[0-9a-fA-F-]{36}$')
+
+_lock = threading.Lock()
+_pending_restores = set()
+
+_EXTRACT_OPTIONS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+def is_archivable_id(instance_id):
+    return bool(instance_id) and bool(_INSTANCE_ID_RE.match(instance_id))
+
+def get_archive_path(instance_id):
+    return os.path.join(INSTANCES_DIR, instance_id + ARCHIVE_SUFFIX)
+
+def instance_exists(instance_id):
+    # Side-effect free: true for live and archived instances alike, without
+    # restoring anything. Used where no disk work may happen yet.
+    if not instance_id:
+        return False
+    return os.path.isdir(os.path.join(INSTANCES_DIR, instance_id)) or is_archived(instance_id)
+
+def is_archived(instance_id):
+    return is_archivable_id(instance_id) and os.path.isfile(get_archive_path(instance_id))
+
+def list_archives():
+    archives = {}
+    with os.scandir(INSTANCES_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(ARCHIVE_SUFFIX):
+                archives[entry.name[:-len(ARCHIVE_SUFFIX)]] = entry.path
+    return archives
+
+def _exclude_transient(tarinfo):
+    if tarinfo.name.startswith('chrome_profile/') and os.path.basename(tarinfo.name) in CHROME_EXCLUDES:
+        return None
+    if not (tarinfo.isfile() or tarinfo.isdir()):
+        return None
+    return tarinfo
+
+def archive_instance(instance_id):
+    if not is_archivable_id(instance_id):
+        return False
+
+    instance_dir = os.path.join(INSTANCES_DIR, instance_id)
+    if not os.path.isdir(instance_dir):
+        return False
+
+    with _lock, timed('instance_archive'):
+        staging_dir = tempfile.mkdtemp(prefix=f'.{instance_id}.', dir=INSTANCES_DIR)
+        try:
+            staged_archive = os.path.join(staging_dir, instance_id + ARCHIVE_SUFFIX)
+            # Only files are archived: the instance's User and Note rows live
+            # in default.db (Flask-SQLAlchemy binds its engine once, at
+            # init_app) and stay there until the archive expires.
+            with tarfile.open(staged_archive, 'w:gz', compresslevel=ARCHIVE_COMPRESSION_LEVEL) as tar:
+                for name in sorted(os.listdir(instance_dir)):
+                    tar.add(os.path.join(instance_dir, name), arcname=name, filter=_exclude_transient)
+
+            os.replace(staged_archive, get_archive_path(instance_id))
+            shutil.rmtree(instance_dir)
+            _pending_restores.discard(instance_id)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    inc('instances_archived_total')
+    logger.info("Archived instance", extra={'instance_id': instance_id})
+    return True
+
+def _safe_members(tar, target_dir):
+    root = os.path.realpath(target_dir)
+    for member in tar.getmembers():
+        if not (member.isfile() or member.isdir()):
+            continue
+        destination = os.path.realpath(os.path.join(root, member.name))
+        if destination != root and not destination.startswith(root + os.sep):
+            continue
+        yield member
+
+def restore_instance(instance_id):
+    if not is_archived(instance_id):
+        return False
+
+    instance_dir = os.path.join(INSTANCES_DIR, instance_id)
+    archive_path = get_archive_path(instance_id)
+
+    with _lock:
+        # Another request may have finished the restore while we waited.
+        if os.path.isdir(instance_dir):
+            return True
+        if not os.path.isfile(archive_path):
+            return False
+
+        with timed('instance_restore'):
+            staging_dir = tempfile.mkdtemp(prefix=f'.{instance_id}.', dir=INSTANCES_DIR)
+            try:
+                restored_dir = os.path.join(staging_dir, instance_id)
+                os.makedirs(restored_dir)
+                with tarfile.open(archive_path, 'r:gz') as tar:
+                    tar.extractall(restored_dir, members=_safe_members(tar, restored_dir), **_EXTRACT_OPTIONS)
+
+                for name in ('notes', 'chrome_profile'):
+                    os.makedirs(os.path.join(restored_dir, name), exist_ok=True)
+
+                # The archive stays until complete_restore() runs, once the
+                # Instance row exists; until then cleanup would see the
+                # directory as an orphan. The pending set is per process:
+                # if another worker serves the next request, cleanup drops
+                # the archive once both the directory and the row exist.
+                os.rename(restored_dir, instance_dir)
+                _pending_restores.add(instance_id)
+            except (OSError, tarfile.TarError) as e:
+                logger.error("Error restoring instance: %s", e, extra={'instance_id': instance_id})
+                return os.path.isdir(instance_dir)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+    inc('instances_restored_total')
+    logger.info("Restored archived instance", extra={'instance_id': instance_id})
+    return True
+
+def is_restore_pending(instance_id):
+    return instance_id in _pending_restores
+
+def complete_restore(instance_id):
+    if instance_id not in _pending_restores:
+        return False
+    with _lock:
+        if instance_id not in _pending_restores:
+            return False
+        _pending_restores.discard(instance_id)
+        try:
+            os.remove(get_archive_path(instance_id))
+        except FileNotFoundError:
+            pass
+    return True
+
+def delete_archive(instance_id):
+    with _lock:
+        try:
+            os.remove(get_archive_path(instance_id))
+        except FileNotFoundError:
+            return False
+    return True
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import uuid
+import statistics
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def count_inodes(path):
+    total = 0
+    for _, dirs, files in os.walk(path):
+        total += len(dirs) + len(files)
+    return total + 1
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def build_instance(instances_dir, files=20, cache_files=200):
+    # Shaped like a real instance: a handful of uploaded notes and a chrome
+    # profile dominated by cache entries. User and Note rows live in
+    # default.db and are not part of the archive.
+    instance_id = str(uuid.uuid4())
+    instance_dir = os.path.join(instances_dir, instance_id)
+    user_dir = os.path.join(instance_dir, "notes", "bench")
+    profile_dir = os.path.join(instance_dir, "chrome_profile", "Default")
+    os.makedirs(user_dir)
+    os.makedirs(os.path.join(profile_dir, "Cache", "Cache_Data"))
+    os.makedirs(os.path.join(profile_dir, "Code Cache", "js"))
+
+    for i in range(files):
+        with open(os.path.join(user_dir, f"file{i}"), "w") as f:
+            f.write(f"uploaded note {i}\n" * 200)
+
+    with open(os.path.join(profile_dir, "Preferences"), "w") as f:
+        f.write('{"profile": {"exit_type": "Normal"}}')
+    with open(os.path.join(profile_dir, "Cookies"), "wb") as f:
+        f.write(os.urandom(16 * 1024))
+    for i in range(cache_files):
+        with open(os.path.join(profile_dir, "Cache", "Cache_Data", f"f_{i:06x}"), "wb") as f:
+            f.write(os.urandom(8 * 1024))
+        with open(os.path.join(profile_dir, "Code Cache", "js", f"{i:016x}_0"), "wb") as f:
+            f.write(os.urandom(4 * 1024))
+
+    return instance_id
+
+def run(runs=10):
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        os.environ.setdefault('METRICS_ENABLED', '0')
+        from config import INSTANCES_DIR
+        from archive import archive_instance, restore_instance, get_archive_path
+
+        archive_times = []
+        restore_times = []
+        sizes = None
+        for _ in range(runs):
+            instance_id = build_instance(INSTANCES_DIR)
+            instance_dir = os.path.join(INSTANCES_DIR, instance_id)
+            before = (disk_usage(instance_dir), count_inodes(instance_dir))
+
+            start = time.perf_counter()
+            archive_instance(instance_id)
+            archive_times.append(time.perf_counter() - start)
+            archived = (disk_usage(get_archive_path(instance_id)), 1)
+
+            start = time.perf_counter()
+            restore_instance(instance_id)
+            restore_times.append(time.perf_counter() - start)
+            after = (disk_usage(instance_dir), count_inodes(instance_dir))
+
+            sizes = sizes or (before, archived, after)
+
+    return archive_times, restore_times, sizes
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    archive_times, restore_times, (before, archived, after) = run(runs)
+
+    print(f"archive: median {statistics.median(archive_times) * 1000:.1f} ms, max {max(archive_times) * 1000:.1f} ms")
+    print(f"restore: median {statistics.median(restore_times) * 1000:.1f} ms, max {max(restore_times) * 1000:.1f} ms")
+    print(f"{'state':<10}{'bytes':>12}{'inodes':>10}")
+    print(f"{'live':<10}{before[0]:>12}{before[1]:>10}")
+    print(f"{'archived':<10}{archived[0]:>12}{archived[1]:>10}")
+    print(f"{'restored':<10}{after[0]:>12}{after[1]:>10}")
@@ -0,0 +1,66 @@
+import time
+import logging
+from instance_manager import get_instance_path
+from metrics import timed
+
+logger = logging.getLogger('bot')
+
+# selenium is imported inside the functions below so that workers which
+# never serve /api/visit do not pay for it at startup.
+
+CHROMEDRIVER_PATH = '/usr/bin/chromedriver'
+
+def get_chrome_options(instance_id):
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+   
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument(f"--user-data-dir={get_instance_path(instance_id, 'chrome_profile')}")
+    
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-plugins")
+    chrome_options.add_argument("--disable-software-rasterizer")
+    chrome_options.add_argument("--disable-webgl")
+    chrome_options.add_argument("--disable-3d-apis")
+    
+    chrome_options.add_argument("--disable-file-system")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-background-timer-throttling")
+    chrome_options.add_argument("--disable-backgrounding-occluded-windows")
+    chrome_options.add_argument("--disable-renderer-backgrounding")
+    
+    chrome_options.add_argument("--disable-popup-blocking")
+    chrome_options.add_argument("--disable-prompt-on-repost")
+    chrome_options.add_argument("--disable-hang-monitor")
+    chrome_options.add_argument("--disable-sync")
+    chrome_options.add_argument("--disable-component-update")
+ 
+    chrome_options.add_argument("--disable-default-apps")
+    chrome_options.add_argument("--disable-notifications")
+
+    return chrome_options
+
+def visit(instance_id, url, wait=15):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    try:
+        with timed('bot_launch'):
+            chrome_options = get_chrome_options(instance_id)
+            driver = webdriver.Chrome(options=chrome_options, service=Service(CHROMEDRIVER_PATH))
+    except Exception as e:
+        logger.error("Bot launch failed: %s", e, extra={'instance_id': instance_id})
+        raise
+    
+    try:
+        with timed('bot_visit'):
+            driver.get(url)
+            time.sleep(wait)
+    except Exception as e:
+        logger.error("Bot visit failed: %s", e, extra={'instance_id': instance_id})
+        raise
+    finally:
+        driver.quit()
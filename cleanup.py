@@ -4,21 +4,25 @@ import shutil
 import threading
 import logging
 from datetime import datetime, timedelta
-from config import INSTANCES_DIR
-from models import db, Instance
-from sqlalchemy import create_engine
+from config import INSTANCES_DIR, ARCHIVE_IDLE_INSTANCES, ARCHIVE_RETENTION
+from models import db, Instance, User, Note
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import sessionmaker
+from metrics import timed, inc, observe
+from logging_config import bind_request_id, new_request_id, reset_request_id
+from quotas import forget as forget_quota_usage, resync_global_bytes
+from archive import archive_instance, list_archives, delete_archive
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger('cleanup')
 
 def update_instance_timestamp(instance_id, app=None):
     if not instance_id:
-        return
+        return False
     
+    with timed('update_instance_timestamp'):
+        return _update_instance_timestamp(instance_id, app)
+
+def _update_instance_timestamp(instance_id, app=None):
     try:
         if app:
             with app.app_context():
@@ -29,7 +33,8 @@ def update_instance_timestamp(instance_id, app=None):
                     instance = Instance(id=instance_id)
                     db.session.add(instance)
                 db.session.commit()
-                logger.info(f"Updated timestamp for instance {instance_id}")
+                logger.info("Updated instance timestamp", extra={'instance_id': instance_id, 'throttle': 'instance_timestamp'})
+                return True
         else:
             engine = create_engine(f'sqlite:///{os.path.join(INSTANCES_DIR, "default.db")}')
             Session = sessionmaker(bind=engine)
@@ -44,23 +49,64 @@ def update_instance_timestamp(instance_id, app=None):
             
             session.commit()
             session.close()
-            logger.info(f"Updated timestamp for instance {instance_id} (no context)")
+            logger.info("Updated instance timestamp (no context)", extra={'instance_id': instance_id, 'throttle': 'instance_timestamp'})
+            return True
     except Exception as e:
-        logger.error(f"Error updating timestamp for {instance_id}: {e}")
+        logger.error("Error updating timestamp: %s", e, extra={'instance_id': instance_id})
+        return False
+
+def _retire_instance(instance_id, instance_dir):
+    if ARCHIVE_IDLE_INSTANCES:
+        try:
+            if archive_instance(instance_id):
+                return True
+        except Exception as e:
+            logger.error("Error archiving instance, deleting it instead: %s", e, extra={'instance_id': instance_id})
+            inc('instances_archive_failures_total')
+    shutil.rmtree(instance_dir)
+    return False
+
+def _delete_instance_rows(session, instance_id):
+    user_ids = select(User.id).where(User.instance_id == instance_id)
+    session.query(Note).filter(Note.user_id.in_(user_ids)).delete(synchronize_session=False)
+    session.query(User).filter(User.instance_id == instance_id).delete(synchronize_session=False)
+
+def _purge_archives(session, now, instance_dirs, db_instances):
+    # User and Note rows live in default.db and stay there while an instance
+    # is archived; they are dropped together with the archive once it expires.
+    count = 0
+    for instance_id, archive_path in list_archives().items():
+        try:
+            if instance_id in instance_dirs and instance_id in db_instances:
+                # Restored by another worker, whose complete_restore() this
+                # process never sees; the live directory supersedes it.
+                if delete_archive(instance_id):
+                    logger.info("Deleting stale archive of restored instance", extra={'instance_id': instance_id})
+            elif instance_id not in instance_dirs and now - os.path.getmtime(archive_path) > ARCHIVE_RETENTION:
+                if delete_archive(instance_id):
+                    _delete_instance_rows(session, instance_id)
+                    logger.info("Deleting expired archive", extra={'instance_id': instance_id})
+                    count += 1
+        except OSError as e:
+            logger.error("Error deleting archive: %s", e, extra={'instance_id': instance_id})
+    return count
 
 def cleanup_instances(max_idle_time=900, app=None):
-    logger.info(f"Starting instance cleanup (inactivity > {max_idle_time} seconds)...")
+    logger.info("Starting instance cleanup (inactivity > %s seconds)...", max_idle_time)
     
+    started = time.perf_counter()
     current_time = datetime.utcnow()
     cutoff_time = current_time - timedelta(seconds=max_idle_time)
     count_removed = 0
     count_orphaned = 0
+    count_archived = 0
+    count_expired = 0
     
     try:
         instance_dirs = set()
         for item in os.listdir(INSTANCES_DIR):
             item_path = os.path.join(INSTANCES_DIR, item)
-            if os.path.isdir(item_path) and item != "default":
+            if os.path.isdir(item_path) and item != "default" and not item.startswith('.'):
                 instance_dirs.add(item)
         
         if app:
@@ -75,31 +121,36 @@ def cleanup_instances(max_idle_time=900, app=None):
                     instance_dir = os.path.join(INSTANCES_DIR, instance_id)
                     if os.path.exists(instance_dir):
                         try:
-                            logger.info(f"Deleting orphaned instance {instance_id}")
+                            logger.info("Deleting orphaned instance", extra={'instance_id': instance_id})
                             shutil.rmtree(instance_dir)
+                            forget_quota_usage(instance_id)
                             count_orphaned += 1
                         except Exception as e:
-                            logger.error(f"Error deleting orphaned instance {instance_id}: {e}")
+                            logger.error("Error deleting orphaned instance: %s", e, extra={'instance_id': instance_id})
                 
                 for instance in inactive_instances:
                     instance_dir = os.path.join(INSTANCES_DIR, instance.id)
                     if os.path.exists(instance_dir):
                         try:
-                            logger.info(f"Deleting inactive instance {instance.id} (last activity: {instance.last_access})")
-                            shutil.rmtree(instance_dir)
-                            count_removed += 1
+                            logger.info("Retiring inactive instance (last activity: %s)", instance.last_access, extra={'instance_id': instance.id})
+                            if _retire_instance(instance.id, instance_dir):
+                                count_archived += 1
+                            else:
+                                count_removed += 1
+                            forget_quota_usage(instance.id)
                         except Exception as e:
-                            logger.error(f"Error deleting instance {instance.id}: {e}")
+                            logger.error("Error deleting instance: %s", e, extra={'instance_id': instance.id})
                     
                     db.session.delete(instance)
-                    logger.info(f"Deleted DB entry for inactive instance {instance.id}")
+                    logger.info("Deleted DB entry for inactive instance", extra={'instance_id': instance.id})
                 
                 for instance_id in all_db_instances - instance_dirs:
                     instance = Instance.query.get(instance_id)
                     if instance:
-                        logger.info(f"Deleting orphaned DB entry {instance_id}")
+                        logger.info("Deleting orphaned DB entry", extra={'instance_id': instance_id})
                         db.session.delete(instance)
                 
+                count_expired = _purge_archives(db.session, time.time(), instance_dirs, all_db_instances)
                 db.session.commit()
         else:
             engine = create_engine(f'sqlite:///{os.path.join(INSTANCES_DIR, "default.db")}')
@@ -116,51 +167,67 @@ def cleanup_instances(max_idle_time=900, app=None):
                 instance_dir = os.path.join(INSTANCES_DIR, instance_id)
                 if os.path.exists(instance_dir):
                     try:
-                        logger.info(f"Deleting orphaned instance {instance_id}")
+                        logger.info("Deleting orphaned instance", extra={'instance_id': instance_id})
                         shutil.rmtree(instance_dir)
+                        forget_quota_usage(instance_id)
                         count_orphaned += 1
                     except Exception as e:
-                        logger.error(f"Error deleting orphaned instance {instance_id}: {e}")
+                        logger.error("Error deleting orphaned instance: %s", e, extra={'instance_id': instance_id})
             
             for instance in inactive_instances:
                 instance_dir = os.path.join(INSTANCES_DIR, instance.id)
                 if os.path.exists(instance_dir):
                     try:
-                        logger.info(f"Deleting inactive instance {instance.id} (last activity: {instance.last_access})")
-                        shutil.rmtree(instance_dir)
-                        count_removed += 1
+                        logger.info("Retiring inactive instance (last activity: %s)", instance.last_access, extra={'instance_id': instance.id})
+                        if _retire_instance(instance.id, instance_dir):
+                            count_archived += 1
+                        else:
+                            count_removed += 1
+                        forget_quota_usage(instance.id)
                     except Exception as e:
-                        logger.error(f"Error deleting instance {instance.id}: {e}")
+                        logger.error("Error deleting instance: %s", e, extra={'instance_id': instance.id})
                 
                 session.delete(instance)
-                logger.info(f"Deleted DB entry for inactive instance {instance.id}")
+                logger.info("Deleted DB entry for inactive instance", extra={'instance_id': instance.id})
             
             for instance_id in all_db_instances - instance_dirs:
                 instance = session.query(Instance).get(instance_id)
                 if instance:
-                    logger.info(f"Deleting orphaned DB entry {instance_id}")
+                    logger.info("Deleting orphaned DB entry", extra={'instance_id': instance_id})
                     session.delete(instance)
             
+            count_expired = _purge_archives(session, time.time(), instance_dirs, all_db_instances)
             session.commit()
             session.close()
+        
+        resync_global_bytes()
     except Exception as e:
-        logger.error(f"Error during instance cleanup: {e}")
+        logger.error("Error during instance cleanup: %s", e)
     
-    logger.info(f"Cleanup complete. {count_removed} inactive instances and {count_orphaned} orphaned instances deleted.")
+    observe('cleanup_duration_seconds', time.perf_counter() - started)
+    inc('cleanup_runs_total')
+    inc('cleanup_instances_removed_total', count_removed, reason='inactive')
+    inc('cleanup_instances_removed_total', count_orphaned, reason='orphaned')
+    inc('cleanup_instances_removed_total', count_archived, reason='archived')
+    inc('cleanup_instances_removed_total', count_expired, reason='expired_archive')
+    logger.info("Cleanup complete. %s inactive instances and %s orphaned instances deleted, %s archived, %s expired archives deleted.", count_removed, count_orphaned, count_archived, count_expired)
 
 def start_cleanup_thread(app, interval=300):
     def cleanup_worker():
         while True:
+            token = bind_request_id(new_request_id('cleanup-'))
             try:
                 cleanup_instances(app=app)
             except Exception as e:
-                logger.error(f"Error in cleanup thread: {e}")
+                logger.error("Error in cleanup thread: %s", e)
+            finally:
+                reset_request_id(token)
             
             time.sleep(interval)
     
     cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
     cleanup_thread.start()
-    logger.info(f"Cleanup thread started (interval: {interval} seconds, inactivity timeout: 15 minutes)")
+    logger.info("Cleanup thread started (interval: %s seconds, inactivity timeout: 15 minutes)", interval)
     
     return cleanup_thread
 
@@ -168,18 +235,18 @@ def verify_cleanup_system():
     logger.info("Verifying cleanup system...")
     
     if not os.path.exists(INSTANCES_DIR):
-        logger.error(f"Instances directory does not exist: {INSTANCES_DIR}")
+        logger.error("Instances directory does not exist: %s", INSTANCES_DIR)
         return False
     
     default_db_path = os.path.join(INSTANCES_DIR, "default.db")
     if not os.path.exists(default_db_path):
-        logger.warning(f"Default database does not exist: {default_db_path}")
+        logger.warning("Default database does not exist: %s", default_db_path)
     
     try:
         instance_dirs = set()
         for item in os.listdir(INSTANCES_DIR):
             item_path = os.path.join(INSTANCES_DIR, item)
-            if os.path.isdir(item_path) and item != "default":
+            if os.path.isdir(item_path) and item != "default" and not item.startswith('.'):
                 instance_dirs.add(item)
         
         engine = create_engine(f'sqlite:///{default_db_path}')
@@ -190,7 +257,7 @@ def verify_cleanup_system():
         try:
             db_instances = set(instance.id for instance in session.query(Instance).all())
         except Exception as e:
-            logger.error(f"Error retrieving instances from DB: {e}")
+            logger.error("Error retrieving instances from DB: %s", e)
         
         session.close()
         
@@ -198,15 +265,15 @@ def verify_cleanup_system():
         orphaned_db_entries = db_instances - instance_dirs
         
         if orphaned_dirs:
-            logger.warning(f"Instance directories without DB entry: {orphaned_dirs}")
+            logger.warning("Instance directories without DB entry: %s", orphaned_dirs)
         
         if orphaned_db_entries:
-            logger.warning(f"DB entries without instance directory: {orphaned_db_entries}")
+            logger.warning("DB entries without instance directory: %s", orphaned_db_entries)
         
-        logger.info(f"Verification complete. {len(instance_dirs)} instance directories, {len(db_instances)} DB entries.")
+        logger.info("Verification complete. %s instance directories, %s DB entries.", len(instance_dirs), len(db_instances))
         return True
     except Exception as e:
-        logger.error(f"Error verifying cleanup system: {e}")
+        logger.error("Error verifying cleanup system: %s", e)
         return False
 
 def test_cleanup_system(debug=False):
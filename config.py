@@ -7,3 +7,38 @@ SECRET_KEY = os.environ.get('SECRET_KEY', os.urandom(24).hex())
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+# /metrics shares the public port, and neither loopback (the bot browses
+# localhost) nor a same-host proxy is a trust boundary, so the endpoint
+# answers only requests carrying "Authorization: Bearer <token>". With no
+# token configured it stays hidden.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_THROTTLE_INTERVAL = float(os.environ.get('LOG_THROTTLE_INTERVAL', '60'))
+LOG_THROTTLE_BURST = int(os.environ.get('LOG_THROTTLE_BURST', '10'))
+
+QUOTAS_ENABLED = os.environ.get('QUOTAS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+QUOTA_REQUEST_RATE = float(os.environ.get('QUOTA_REQUEST_RATE', '20'))
+QUOTA_REQUEST_BURST = int(os.environ.get('QUOTA_REQUEST_BURST', '60'))
+QUOTA_INSTANCES_PER_HOUR = int(os.environ.get('QUOTA_INSTANCES_PER_HOUR', '20'))
+QUOTA_INSTANCE_BURST = int(os.environ.get('QUOTA_INSTANCE_BURST', '5'))
+# Clients without a known instance are rate limited by address. Behind a
+# reverse proxy every client would share the proxy's address (and a proxy on
+# the same host would look like loopback, which is exempt for the bot), so
+# set this to the number of proxies whose X-Forwarded-For should be trusted.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
+QUOTA_MAX_NOTES = int(os.environ.get('QUOTA_MAX_NOTES', '200'))
+QUOTA_MAX_BYTES = int(os.environ.get('QUOTA_MAX_BYTES', str(2 * 1024 * 1024)))
+# Cap on uploaded note bytes across all instances on disk. Each worker rescans
+# instances/ at startup and after every cleanup pass, so between scans it only
+# sees its own uploads: with N workers the cap can overshoot by whatever the
+# other workers wrote since the last scan.
+QUOTA_GLOBAL_MAX_BYTES = int(os.environ.get('QUOTA_GLOBAL_MAX_BYTES', str(1024 * 1024 * 1024)))
+QUOTA_BOT_VISITS_PER_HOUR = int(os.environ.get('QUOTA_BOT_VISITS_PER_HOUR', '30'))
+QUOTA_BOT_MAX_CONCURRENT = int(os.environ.get('QUOTA_BOT_MAX_CONCURRENT', '4'))
+
+ARCHIVE_IDLE_INSTANCES = os.environ.get('ARCHIVE_IDLE_INSTANCES', '1').lower() not in ('0', 'false', 'no', 'off')
+ARCHIVE_RETENTION = int(os.environ.get('ARCHIVE_RETENTION', str(60 * 60 * 24 * 30)))
+ARCHIVE_COMPRESSION_LEVEL = int(os.environ.get('ARCHIVE_COMPRESSION_LEVEL', '6'))
@@ -1,33 +1,48 @@
 import os
 import uuid
+import logging
 from flask import request, current_app, session
 from config import INSTANCES_DIR
 from cleanup import update_instance_timestamp
+from quotas import start_tracking
+from archive import restore_instance, is_restore_pending, complete_restore
+
+logger = logging.getLogger('instance_manager')
 
 def is_valid_instance_id(instance_id):
     if not instance_id:
         return False
     
     instance_dir = os.path.join(INSTANCES_DIR, instance_id)
-    return os.path.exists(instance_dir)
+    if os.path.exists(instance_dir):
+        return True
+    
+    return restore_instance(instance_id)
+
+def _finish_restore(instance_id):
+    if is_restore_pending(instance_id) and update_instance_timestamp(instance_id, app=current_app):
+        complete_restore(instance_id)
 
 def get_or_create_instance_id():
     if 'instance_id' in session and is_valid_instance_id(session['instance_id']):
+        _finish_restore(session['instance_id'])
         return session['instance_id']
     
     instance_id = request.cookies.get('INSTANCE')
     
     if not is_valid_instance_id(instance_id):
         instance_id = str(uuid.uuid4())
-        print(f"Creating new instance: {instance_id}")
+        logger.info("Creating new instance", extra={'instance_id': instance_id})
     
     instance_dir = os.path.join(INSTANCES_DIR, instance_id)
     if not os.path.exists(instance_dir):
         os.makedirs(instance_dir)
         os.makedirs(os.path.join(instance_dir, "notes"), exist_ok=True)
         os.makedirs(os.path.join(instance_dir, "chrome_profile"), exist_ok=True)
+        start_tracking(instance_id)
     
-    update_instance_timestamp(instance_id, app=current_app)
+    if update_instance_timestamp(instance_id, app=current_app):
+        complete_restore(instance_id)
     
     session['instance_id'] = instance_id
     
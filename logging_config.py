@@ -0,0 +1,140 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from metrics import inc
+from config import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_THROTTLE_INTERVAL, LOG_THROTTLE_BURST
+
+request_id_var = ContextVar('request_id', default='-')
+
+_listener = None
+_setup_lock = threading.Lock()
+
+_RESERVED = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime', 'request_id', 'throttle'}
+
+def new_request_id(prefix=''):
+    return f'{prefix}{uuid.uuid4().hex[:16]}'
+
+def bind_request_id(request_id=None):
+    return request_id_var.set(request_id or new_request_id())
+
+def reset_request_id(token):
+    request_id_var.reset(token)
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+class ThrottleFilter(logging.Filter):
+    # Records logged with extra={'throttle': key} share a token bucket per
+    # key; anything over the burst is dropped and counted, and the next
+    # record that gets through reports how many were suppressed.
+    def __init__(self, interval=LOG_THROTTLE_INTERVAL, burst=LOG_THROTTLE_BURST):
+        super().__init__()
+        self.rate = burst / interval if interval > 0 else float('inf')
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'throttle', None)
+        if key is None or self.rate == float('inf'):
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                inc('log_records_throttled_total', key=key)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _PreparedQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # The listener formats to JSON; only flatten args and exceptions here
+        # so the producing thread never pays for serialisation.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # A full queue means the writer is behind; drop rather than block the
+        # request thread.
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            inc('log_records_dropped_total')
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+
+        handler = _PreparedQueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(ThrottleFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+        return _listener
+
+def stop_logging():
+    global _listener
+
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
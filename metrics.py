@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import METRICS_ENABLED, INSTANCES_DIR
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timers = {}
+_collectors = []
+_help = {}
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def describe(name, text):
+    _help[name] = text
+
+def inc(name, value=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def add_gauge(name, value, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None:
+            _timers[key] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+@contextmanager
+def timed(stage):
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('app_stage_duration_seconds', time.perf_counter() - start, stage=stage)
+
+def register_collector(collector):
+    # Collectors run at scrape time only, so expensive gauges (directory
+    # listings, row counts) never land on the request path.
+    _collectors.append(collector)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+    observe('sqlite_query_duration_seconds', elapsed, operation=verb)
+
+def instrument_sqlalchemy():
+    if not METRICS_ENABLED:
+        return
+    if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def _emit_header(lines, seen, name, kind):
+    if name in seen:
+        return
+    seen.add(name)
+    if name in _help:
+        lines.append(f'# HELP {name} {_help[name]}')
+    lines.append(f'# TYPE {name} {kind}')
+
+def render():
+    for collector in list(_collectors):
+        try:
+            collector()
+        except Exception:
+            inc('metrics_collector_errors_total')
+
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        timers = sorted((key, list(value)) for key, value in _timers.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        _emit_header(lines, seen, name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), value in gauges:
+        _emit_header(lines, seen, name, 'gauge')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), (count, total, maximum) in timers:
+        _emit_header(lines, seen, name, 'summary')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total:.6f}')
+    for (name, labels), (count, total, maximum) in timers:
+        _emit_header(lines, seen, f'{name}_max', 'gauge')
+        lines.append(f'{name}_max{_format_labels(labels)} {maximum:.6f}')
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timers.clear()
+
+describe('app_stage_duration_seconds', 'Time spent in instrumented request stages.')
+describe('sqlite_query_duration_seconds', 'SQLite statement execution time by operation.')
+describe('bot_active', 'Chrome bot sessions currently running.')
+describe('bot_visits_total', 'Bot visits by outcome.')
+describe('cleanup_runs_total', 'Completed cleanup passes.')
+describe('cleanup_duration_seconds', 'Wall time of each cleanup pass.')
+describe('cleanup_instances_removed_total', 'Instances removed by cleanup, by reason.')
+describe('instances_on_disk', 'Instance directories present under the instances directory.')
+describe('instances_archived', 'Idle instances stored as compressed archives.')
+
+def collect_instance_count():
+    count = 0
+    archived = 0
+    with os.scandir(INSTANCES_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name != 'default' and not entry.name.startswith('.'):
+                count += 1
+            elif entry.is_file() and entry.name.endswith('.tar.gz'):
+                archived += 1
+    set_gauge('instances_on_disk', count)
+    set_gauge('instances_archived', archived)
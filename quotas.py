@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from flask import has_app_context
+from config import (
+    INSTANCES_DIR,
+    QUOTAS_ENABLED,
+    QUOTA_REQUEST_RATE,
+    QUOTA_REQUEST_BURST,
+    QUOTA_INSTANCES_PER_HOUR,
+    QUOTA_INSTANCE_BURST,
+    QUOTA_MAX_NOTES,
+    QUOTA_MAX_BYTES,
+    QUOTA_GLOBAL_MAX_BYTES,
+    QUOTA_BOT_VISITS_PER_HOUR,
+    QUOTA_BOT_MAX_CONCURRENT,
+)
+from models import User, Note
+from metrics import inc, set_gauge
+
+logger = logging.getLogger('quotas')
+
+MAX_TRACKED_BUCKETS = 10000
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1):
+        self._refill(time.monotonic())
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def retry_after(self, amount=1):
+        if self.rate <= 0:
+            return 3600
+        return max(1, int((amount - self.tokens) / self.rate) + 1)
+
+    def is_full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class InstanceUsage:
+    def __init__(self, notes=0, bytes_used=0):
+        self.notes = notes
+        self.bytes_used = bytes_used
+
+class QuotaExceeded(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+_lock = threading.Lock()
+_usage = {}
+_global_bytes = None
+_request_buckets = OrderedDict()
+_bot_buckets = OrderedDict()
+_creation_buckets = OrderedDict()
+_bot_slots = threading.BoundedSemaphore(QUOTA_BOT_MAX_CONCURRENT)
+
+def _seed_usage(instance_id):
+    # One-off baseline for instances this process has not seen yet; after
+    # this the counters are only adjusted by record_* calls.
+    instance_dir = os.path.join(INSTANCES_DIR, instance_id)
+    usage = InstanceUsage()
+
+    if has_app_context():
+        try:
+            usage.notes = Note.query.join(User).filter(User.instance_id == instance_id).count()
+        except Exception as e:
+            logger.error("Error counting notes for quota: %s", e, extra={'instance_id': instance_id})
+    else:
+        logger.warning("No app context, note count starts at zero", extra={'instance_id': instance_id})
+
+    usage.bytes_used = _notes_bytes(instance_dir)
+    return usage
+
+def _notes_bytes(instance_dir):
+    total = 0
+    notes_dir = os.path.join(instance_dir, "notes")
+    if os.path.isdir(notes_dir):
+        with os.scandir(notes_dir) as users:
+            for user_entry in users:
+                if not user_entry.is_dir():
+                    continue
+                with os.scandir(user_entry.path) as files:
+                    for file_entry in files:
+                        if file_entry.is_file():
+                            total += file_entry.stat().st_size
+    return total
+
+def resync_global_bytes():
+    # The global total covers every instance on disk, not just the ones this
+    # worker has served. It is rebuilt at startup and after each cleanup pass
+    # and adjusted incrementally in between; a worker does not see uploads
+    # made by other workers until the next rescan.
+    global _global_bytes
+
+    total = 0
+    with os.scandir(INSTANCES_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name != 'default' and not entry.name.startswith('.'):
+                total += _notes_bytes(entry.path)
+    with _lock:
+        _global_bytes = total
+        set_gauge('quota_global_bytes', total)
+    return total
+
+def _get_usage(instance_id):
+    with _lock:
+        usage = _usage.get(instance_id)
+    if usage is not None:
+        return usage
+
+    # Archived instances have no directory yet; do not cache a zero baseline
+    # that would outlive the restore.
+    if not os.path.isdir(os.path.join(INSTANCES_DIR, instance_id)):
+        return InstanceUsage()
+
+    seeded = _seed_usage(instance_id)
+    with _lock:
+        usage = _usage.get(instance_id)
+        if usage is None:
+            usage = _usage[instance_id] = seeded
+    return usage
+
+def start_tracking(instance_id):
+    with _lock:
+        _usage.setdefault(instance_id, InstanceUsage())
+
+def forget(instance_id):
+    with _lock:
+        _usage.pop(instance_id, None)
+        _request_buckets.pop(instance_id, None)
+        _bot_buckets.pop(instance_id, None)
+
+def record_note(instance_id, delta=1, size=0):
+    global _global_bytes
+
+    usage = _get_usage(instance_id)
+    with _lock:
+        usage.notes = max(0, usage.notes + delta)
+        if size:
+            usage.bytes_used = max(0, usage.bytes_used + size)
+            if _global_bytes is not None:
+                _global_bytes = max(0, _global_bytes + size)
+                set_gauge('quota_global_bytes', _global_bytes)
+
+def get_usage(instance_id):
+    usage = _get_usage(instance_id)
+    return {'notes': usage.notes, 'bytes': usage.bytes_used}
+
+def _bucket(buckets, key, rate, capacity):
+    # Least recently used keys are evicted first; an evicted key simply
+    # starts again from a full bucket.
+    bucket = buckets.get(key)
+    if bucket is None:
+        if len(buckets) >= MAX_TRACKED_BUCKETS:
+            buckets.popitem(last=False)
+        bucket = buckets[key] = TokenBucket(rate, capacity)
+    else:
+        buckets.move_to_end(key)
+    return bucket
+
+def _reject(reason, message, retry_after=None):
+    inc('quota_rejections_total', reason=reason)
+    raise QuotaExceeded(message, retry_after)
+
+def check_request(key):
+    if not QUOTAS_ENABLED:
+        return
+    with _lock:
+        bucket = _bucket(_request_buckets, key, QUOTA_REQUEST_RATE, QUOTA_REQUEST_BURST)
+        allowed = bucket.take()
+        retry_after = None if allowed else bucket.retry_after()
+    if not allowed:
+        _reject('request_rate', "Too many requests", retry_after)
+
+def check_instance_creation(client):
+    if not QUOTAS_ENABLED:
+        return
+    with _lock:
+        bucket = _bucket(_creation_buckets, client, QUOTA_INSTANCES_PER_HOUR / 3600.0, QUOTA_INSTANCE_BURST)
+        allowed = bucket.take()
+        retry_after = None if allowed else bucket.retry_after()
+    if not allowed:
+        _reject('instance_creation', "Too many new instances, try again later", retry_after)
+
+def check_note(instance_id, size=0):
+    # size is the net number of bytes the write adds, i.e. the same amount
+    # record_note() will charge afterwards.
+    if not QUOTAS_ENABLED:
+        return
+    usage = _get_usage(instance_id)
+    if _global_bytes is None:
+        resync_global_bytes()
+    with _lock:
+        notes = usage.notes
+        bytes_used = usage.bytes_used
+        global_bytes = _global_bytes
+    if notes >= QUOTA_MAX_NOTES:
+        _reject('notes', "Note limit reached for this instance")
+    if size > 0 and bytes_used + size > QUOTA_MAX_BYTES:
+        _reject('bytes', "Storage limit reached for this instance")
+    if size > 0 and global_bytes + size > QUOTA_GLOBAL_MAX_BYTES:
+        _reject('global_bytes', "Storage is full, try again later", 60)
+
+def acquire_bot_slot(instance_id):
+    if not QUOTAS_ENABLED:
+        return False
+    if not _bot_slots.acquire(blocking=False):
+        _reject('bot_concurrency', "The bot is busy, try again later", 15)
+    with _lock:
+        bucket = _bucket(_bot_buckets, instance_id, QUOTA_BOT_VISITS_PER_HOUR / 3600.0, QUOTA_BOT_VISITS_PER_HOUR)
+        allowed = bucket.take()
+        retry_after = None if allowed else bucket.retry_after()
+    if not allowed:
+        _bot_slots.release()
+        _reject('bot_rate', "Bot visit limit reached for this instance", retry_after)
+    return True
+
+def release_bot_slot():
+    _bot_slots.release()
@@ -1,16 +1,21 @@
 import os
 import re
-import time
+import hmac
+import logging
 
-from flask import render_template, request, jsonify, send_from_directory, make_response, session
+from flask import render_template, request, jsonify, send_from_directory, make_response, session, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from selenium import webdriver
 from sqlalchemy.orm.exc import NoResultFound
 from models import db, User, Note
 from instance_manager import get_or_create_instance_id, get_instance_path, set_instance_cookie
-from utils import sanitize_filename, sanitize_username, get_chrome_options
-from selenium.webdriver.chrome.service import Service
+from utils import sanitize_filename, sanitize_username
+from bot import visit as bot_visit
+from config import METRICS_ENABLED, METRICS_TOKEN
+from metrics import timed, inc, add_gauge, render as render_metrics
+from quotas import QuotaExceeded, record_note, check_note, acquire_bot_slot, release_bot_slot
+
+logger = logging.getLogger('routes')
 
 def register_routes(app):
 
@@ -21,9 +26,27 @@ def register_routes(app):
             instance_id
         ), status_code
 
+    def quota_response(exc):
+        response, status_code = error_response(exc.message, 429)
+        if exc.retry_after:
+            response.headers['Retry-After'] = str(exc.retry_after)
+        return response, status_code
+
     def validate_url(url):
         return url.startswith("http://localhost:1337/")
 
+    def metrics_allowed():
+        if not METRICS_TOKEN:
+            return False
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied, f'Bearer {METRICS_TOKEN}')
+
+    @app.route('/metrics')
+    def metrics():
+        if not METRICS_ENABLED or not metrics_allowed():
+            return render_template('404.html'), 404
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
     @app.errorhandler(404)
     def page_not_found(error):
         return render_template('404.html'), 404
@@ -124,40 +147,42 @@ def register_routes(app):
 
         db_file_names = set()
         pattern = r'/download/[^/]+/([^"]+)'
-        for note in db_notes:
-            match = re.search(pattern, note.content)
-            if match:
-                db_file_names.add(match.group(1))
-            if hasattr(note, 'filename') and note.filename:
-                db_file_names.add(note.filename)
+        with timed('notes_regex_scan'):
+            for note in db_notes:
+                match = re.search(pattern, note.content)
+                if match:
+                    db_file_names.add(match.group(1))
+                if hasattr(note, 'filename') and note.filename:
+                    db_file_names.add(note.filename)
 
         user_dir = get_instance_path(instance_id, "notes", current_user.username)
-        if os.path.exists(user_dir):
-            for filename in os.listdir(user_dir):
-                if filename in db_file_names:
-                    continue
-                file_path = os.path.join(user_dir, filename)
-                if os.path.isfile(file_path):
-                    download_link = f'/download/{current_user.username}/{filename}'
-                
-                    preview_content = ""
-                    try:
-                        with open(file_path, 'r', errors='replace') as f:
-                            lines = []
-                            for i, line in enumerate(f):
-                                if i >= 2:
-                                    break
-                                lines.append(line.strip())
-                            preview_content = "\n".join(lines)
-                    except Exception as e:
-                        preview_content = f"[Preview not available for {filename}]"
+        with timed('notes_file_scan'):
+            if os.path.exists(user_dir):
+                for filename in os.listdir(user_dir):
+                    if filename in db_file_names:
+                        continue
+                    file_path = os.path.join(user_dir, filename)
+                    if os.path.isfile(file_path):
+                        download_link = f'/download/{current_user.username}/{filename}'
                     
-                    notes_list.append({
-                        'id': None, 
-                        'content': preview_content,
-                        'download_link': download_link,
-                        'filename': filename
-                    })
+                        preview_content = ""
+                        try:
+                            with open(file_path, 'r', errors='replace') as f:
+                                lines = []
+                                for i, line in enumerate(f):
+                                    if i >= 2:
+                                        break
+                                    lines.append(line.strip())
+                                preview_content = "\n".join(lines)
+                        except Exception as e:
+                            preview_content = f"[Preview not available for {filename}]"
+                        
+                        notes_list.append({
+                            'id': None, 
+                            'content': preview_content,
+                            'download_link': download_link,
+                            'filename': filename
+                        })
     
         return set_instance_cookie(
             jsonify({'success': True, 'notes': notes_list}),
@@ -177,6 +202,7 @@ def register_routes(app):
         note = Note(content=content, user_id=current_user.id)
         db.session.add(note)
         db.session.commit()
+        record_note(instance_id)
         
         return set_instance_cookie(
             jsonify({'success': True, 'message': "Note added"}),
@@ -193,13 +219,16 @@ def register_routes(app):
             if not note:
                 return error_response("Note not found", 404)
 
+            freed = 0
             if hasattr(note, 'filename') and note.filename:
                 user_dir = get_instance_path(instance_id, "notes", current_user.username)
                 file_path = os.path.join(user_dir, note.filename)
                 if os.path.exists(file_path):
                     try:
+                        freed = os.path.getsize(file_path)
                         os.remove(file_path)
-                    except Exception:
+                    except Exception as e:
+                        logger.error("Error deleting file: %s", e, extra={'instance_id': instance_id})
                         return error_response("Error deleting file", 500)
             else:
                 pattern = r'/download/[^/]+/([^"]+)'
@@ -210,12 +239,15 @@ def register_routes(app):
                     file_path = os.path.join(user_dir, filename)
                     if os.path.exists(file_path):
                         try:
+                            freed = os.path.getsize(file_path)
                             os.remove(file_path)
-                        except Exception:
+                        except Exception as e:
+                            logger.error("Error deleting file: %s", e, extra={'instance_id': instance_id})
                             return error_response("Error deleting file", 500)
 
             db.session.delete(note)
             db.session.commit()
+            record_note(instance_id, -1, -freed)
             
             return set_instance_cookie(
                 jsonify({'success': True, 'message': "Note or file deleted"}),
@@ -237,35 +269,42 @@ def register_routes(app):
             return error_response("No file selected", 400)
 
         file.seek(0, os.SEEK_END)
-        if file.tell() > 20 * 1024:
+        file_size = file.tell()
+        if file_size > 20 * 1024:
             return error_response("File size exceeds 20KB limit.", 400)
         file.seek(0)
 
         notes_dir = get_instance_path(instance_id, "notes")
-        os.makedirs(notes_dir, exist_ok=True)
-        
         user_dir = os.path.join(notes_dir, current_user.username)
-        os.makedirs(user_dir, exist_ok=True)
-        
         filename = sanitize_filename(file.filename)
         file_path = os.path.join(user_dir, filename)
+        replaced = os.path.getsize(file_path) if os.path.isfile(file_path) else 0
         
         try:
-            file.save(file_path)
-        except Exception:
-            return error_response("Error saving file", 500)
+            check_note(instance_id, size=file_size - replaced)
+        except QuotaExceeded as e:
+            return quota_response(e)
+        
+        os.makedirs(user_dir, exist_ok=True)
+        
+        with timed('upload_file_io'):
+            try:
+                file.save(file_path)
+            except Exception as e:
+                logger.error("Error saving file: %s", e, extra={'instance_id': instance_id})
+                return error_response("Error saving file", 500)
 
-        preview_content = ""
-        try:
-            with open(file_path, 'r', errors='replace') as f:
-                lines = []
-                for i, line in enumerate(f):
-                    if i >= 2:
-                        break
-                    lines.append(line.strip())
-                preview_content = "\n".join(lines)
-        except Exception as e:
-            preview_content = f"[Preview not available for {filename}]"
+            preview_content = ""
+            try:
+                with open(file_path, 'r', errors='replace') as f:
+                    lines = []
+                    for i, line in enumerate(f):
+                        if i >= 2:
+                            break
+                        lines.append(line.strip())
+                    preview_content = "\n".join(lines)
+            except Exception as e:
+                preview_content = f"[Preview not available for {filename}]"
         
         download_link = f'/download/{current_user.username}/{filename}'
         
@@ -277,6 +316,7 @@ def register_routes(app):
         )
         db.session.add(note)
         db.session.commit()
+        record_note(instance_id, 1, file_size - replaced)
         
         return set_instance_cookie(
             jsonify({'success': True, 'message': "File uploaded successfully"}),
@@ -312,19 +352,24 @@ def register_routes(app):
         }
         
         try:
-            chrome_options = get_chrome_options(instance_id)
-            driver = webdriver.Chrome(options=chrome_options, service=Service('/usr/bin/chromedriver'))
-            
-            driver.get(url)
-            time.sleep(15)
-            
-            driver.quit()
+            bot_slot = acquire_bot_slot(instance_id)
+        except QuotaExceeded as e:
+            return quota_response(e)
+        
+        add_gauge('bot_active', 1)
+        try:
+            bot_visit(instance_id, url)
             
             response['message'] = 'Page visited successfully!'
             response['status'] = 'visit_complete'
+            inc('bot_visits_total', outcome='success')
             
             return set_instance_cookie(jsonify(response), instance_id)
-        except Exception as e:
-            print(f"Bot error: {str(e)}")
+        except Exception:
+            inc('bot_visits_total', outcome='error')
             return error_response('Bot crash...', 500)
+        finally:
+            add_gauge('bot_active', -1)
+            if bot_slot:
+                release_bot_slot()
 